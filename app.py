@@ -1,8 +1,9 @@
-from ragsst.ragtool import RAGTool
-from ragsst.interface import make_interface
-
-
 def main():
+    # Imported here, so that the ingest worker processes, which import this module
+    # when spawned, do not load the models, the database client and the UI
+    from ragsst.ragtool import RAGTool
+    from ragsst.interface import make_interface
+
     ragsst = RAGTool()
     ragsst.setup_vec_store()
 
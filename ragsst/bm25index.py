@@ -0,0 +1,82 @@
+import os
+import re
+import pickle
+import numpy as np
+from rank_bm25 import BM25Plus
+from typing import List
+
+
+def tokenize(text: str) -> List[str]:
+    return re.findall(r'\w+', text.lower())
+
+
+class BM25Index:
+    """BM25 keyword index over the chunks of a collection, persisted as <path>.bm25.pkl.
+
+    Like the FAISS index, it is built from the entries of the Chroma collection, keeps
+    the fingerprint of the content it was built from and its query results follow the
+    Chroma query result layout. BM25+ is used since its idf stays positive for terms
+    found in most chunks, unlike the Okapi variant.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.bm25 = None
+        self.ids: List[str] = []
+        self.documents: List[str] = []
+        self.metadatas: List[dict] = []
+        self.fingerprint = ''
+
+    def count(self) -> int:
+        return len(self.ids)
+
+    def build(
+        self,
+        ids: List[str],
+        documents: List[str],
+        metadatas: List[dict],
+        fingerprint: str = '',
+    ) -> None:
+        """Index the given entries, replacing the current content"""
+        bm25 = BM25Plus([tokenize(doc) for doc in documents]) if ids else None
+        self.ids, self.documents, self.metadatas = list(ids), list(documents), list(metadatas)
+        self.bm25, self.fingerprint = bm25, fingerprint
+
+    def query(self, query: str, n_results: int = 2) -> dict:
+        """Get the best matching entries. Entries without any query term are left out"""
+        terms = tokenize(query)
+        scores = self.bm25.get_scores(terms)
+        # BM25+ gives every entry idf * delta per query term, so entries without any
+        # of the terms share this base score and rank below all the matching ones
+        base = sum((self.bm25.idf.get(t) or 0) * self.bm25.delta for t in terms)
+        top = [i for i in np.argsort(scores)[::-1][:n_results] if scores[i] > base + 1e-9]
+        return {
+            'ids': [[self.ids[i] for i in top]],
+            'documents': [[self.documents[i] for i in top]],
+            'metadatas': [[self.metadatas[i] for i in top]],
+            'scores': [[float(scores[i]) for i in top]],
+        }
+
+    def save(self) -> None:
+        if self.bm25 is None:
+            self.remove()
+            return
+        with open(self.path + '.bm25.pkl', 'wb') as f:
+            pickle.dump((self.ids, self.documents, self.metadatas, self.bm25, self.fingerprint), f)
+
+    def load(self) -> bool:
+        """Load a persisted index. Returns False if there is none"""
+        if not os.path.exists(self.path + '.bm25.pkl'):
+            return False
+        with open(self.path + '.bm25.pkl', 'rb') as f:
+            saved = pickle.load(f)
+        # Indexes saved by former versions (Okapi variant, no fingerprint) are rebuilt
+        if len(saved) != 5 or not isinstance(saved[3], BM25Plus):
+            return False
+        self.ids, self.documents, self.metadatas, self.bm25, self.fingerprint = saved
+        return True
+
+    def remove(self) -> None:
+        """Delete the persisted index file"""
+        if os.path.exists(self.path + '.bm25.pkl'):
+            os.remove(self.path + '.bm25.pkl')
@@ -0,0 +1,201 @@
+import os
+import numpy as np
+import torch
+from typing import Any, Dict
+from chromadb.api.types import Documents, EmbeddingFunction, Embeddings
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+import ragsst.parameters as p
+
+
+def _token_embeddings_to_fp32(module: torch.nn.Module, args: tuple) -> None:
+    """Forward pre-hook casting the transformer output to fp32 before pooling"""
+    features = args[0]
+    features["token_embeddings"] = features["token_embeddings"].float()
+
+
+def _hub_model_name(model_name: str) -> str:
+    """Full Hub name of a model, prefixing short names as SentenceTransformer does"""
+    if '/' in model_name or os.path.exists(model_name):
+        return model_name
+    return "sentence-transformers/" + model_name
+
+
+class QuantizedSentenceTransformerEmbeddingFunction(SentenceTransformerEmbeddingFunction):
+    """SentenceTransformer embeddings computed with reduced precision weights.
+
+    "fp16" halves the transformer weights (GPU), "int8" applies dynamic quantization
+    to the Linear layers (CPU). Pooling and the following modules stay in fp32.
+    """
+
+    # Separate from the parent cache, which holds the full precision models
+    models: Dict[str, Any] = {}
+    _reduced: set = set()
+
+    def __init__(self, model_name: str, precision: str = "int8", device: str = "cpu", **kwargs):
+        super().__init__(model_name=model_name, device=device, **kwargs)
+        if model_name not in self._reduced:
+            self.models[model_name] = self._reduce_precision(self._model, precision)
+            self._reduced.add(model_name)
+        self._model = self.models[model_name]
+
+    @staticmethod
+    def _reduce_precision(model: torch.nn.Module, precision: str) -> torch.nn.Module:
+        if precision == "fp16":
+            model.half()
+            modules = list(model.children())
+            for module in modules[1:]:
+                module.float()
+            modules[1].register_forward_pre_hook(_token_embeddings_to_fp32)
+        elif precision == "int8":
+            model = torch.quantization.quantize_dynamic(
+                model, {torch.nn.Linear}, dtype=torch.qint8
+            )
+        else:
+            raise ValueError(f"Unsupported precision: {precision}")
+        return model
+
+
+class OnnxEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Sentence embeddings from an ONNX Runtime export of a Hugging Face model.
+
+    The model is exported (and optionally INT8 quantized) once and kept in the
+    models cache folder. Mean pooling and L2 normalization are done with NumPy.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        quantize: bool = True,
+        batch_size: int = 32,
+        cache_dir: str = p.MODELS_CACHE_PATH,
+        trust_remote_code: bool = True,
+    ):
+        from optimum.onnxruntime import ORTModelForFeatureExtraction, ORTQuantizer
+        from optimum.onnxruntime.configuration import AutoQuantizationConfig
+        from transformers import AutoTokenizer
+
+        self.batch_size = batch_size
+        model_name = _hub_model_name(model_name)
+        export_dir = os.path.join(cache_dir, model_name.replace('/', '--') + '-onnx')
+        model_file = "model_quantized.onnx" if quantize else "model.onnx"
+
+        if not os.path.exists(os.path.join(export_dir, model_file)):
+            model = ORTModelForFeatureExtraction.from_pretrained(
+                model_name,
+                export=True,
+                provider="CPUExecutionProvider",
+                trust_remote_code=trust_remote_code,
+            )
+            model.save_pretrained(export_dir)
+            if quantize:
+                qconfig = AutoQuantizationConfig.avx2(is_static=False, per_channel=False)
+                ORTQuantizer.from_pretrained(model).quantize(
+                    save_dir=export_dir, quantization_config=qconfig
+                )
+
+        self.model = ORTModelForFeatureExtraction.from_pretrained(
+            export_dir, file_name=model_file, provider="CPUExecutionProvider"
+        )
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            model_name, trust_remote_code=trust_remote_code
+        )
+        self.max_seq_length = min(self.tokenizer.model_max_length, 512)
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            # Dynamic padding: pad only up to the longest text of the batch
+            encoded = self.tokenizer(
+                texts[start : start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="np",
+            )
+            token_embeddings = self.model(**encoded).last_hidden_state
+            mask = encoded["attention_mask"][..., None].astype(np.float32)
+            pooled = (token_embeddings * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled /= np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            # Chroma expects each embedding as a list of floats
+            embeddings.extend(pooled.tolist())
+        return embeddings
+
+
+class TorchScriptEmbeddingFunction(EmbeddingFunction[Documents]):
+    """Sentence embeddings from a TorchScript trace of a SentenceTransformer model.
+
+    The transformer is traced once per device and saved to the models cache folder.
+    Later starts load the saved graph with torch.jit.load instead of building the model.
+    Mean pooling and L2 normalization are applied to the traced output.
+    """
+
+    def __init__(
+        self,
+        model_name: str,
+        batch_size: int = 32,
+        device: str = "cpu",
+        cache_dir: str = p.MODELS_CACHE_PATH,
+        trust_remote_code: bool = True,
+    ):
+        from transformers import AutoTokenizer
+
+        self.batch_size = batch_size
+        self.device = device
+        model_name = _hub_model_name(model_name)
+        self.tokenizer = AutoTokenizer.from_pretrained(
+            model_name, trust_remote_code=trust_remote_code
+        )
+
+        # A trace records device specific ops: keep one per device
+        trace_name = f"{model_name.replace('/', '--')}-{device.replace(':', '-')}.ts"
+        trace_path = os.path.join(cache_dir, trace_name)
+        if not os.path.exists(trace_path):
+            self._trace(model_name, trace_path, trust_remote_code)
+
+        extra_files = {"max_seq_length": ""}
+        self.model = torch.jit.load(trace_path, map_location=device, _extra_files=extra_files)
+        self.model.eval()
+        self.max_seq_length = int(extra_files["max_seq_length"])
+        # Run the graph once, so that a trace that fails to execute raises here
+        self(["Warm-up"])
+
+    def _trace(self, model_name: str, trace_path: str, trust_remote_code: bool) -> None:
+        from sentence_transformers import SentenceTransformer
+
+        st_model = SentenceTransformer(
+            model_name, device=self.device, trust_remote_code=trust_remote_code
+        )
+        transformer = st_model[0].auto_model.eval()
+        transformer.config.return_dict = False
+        example = dict(
+            self.tokenizer(["A sentence to trace the model with."], return_tensors="pt").to(
+                self.device
+            )
+        )
+        with torch.no_grad():
+            traced = torch.jit.trace(transformer, example_kwarg_inputs=example, strict=False)
+        os.makedirs(os.path.dirname(trace_path), exist_ok=True)
+        torch.jit.save(
+            traced, trace_path, _extra_files={"max_seq_length": str(st_model.max_seq_length)}
+        )
+
+    def __call__(self, input: Documents) -> Embeddings:
+        texts = list(input)
+        embeddings = []
+        for start in range(0, len(texts), self.batch_size):
+            encoded = self.tokenizer(
+                texts[start : start + self.batch_size],
+                padding=True,
+                truncation=True,
+                max_length=self.max_seq_length,
+                return_tensors="pt",
+            ).to(self.device)
+            with torch.inference_mode():
+                token_embeddings = self.model(**encoded)[0]
+            mask = encoded["attention_mask"].unsqueeze(-1).to(token_embeddings.dtype)
+            pooled = (token_embeddings * mask).sum(dim=1) / mask.sum(dim=1).clamp(min=1e-9)
+            pooled = torch.nn.functional.normalize(pooled, p=2, dim=1)
+            # Chroma expects each embedding as a list of floats
+            embeddings.extend(pooled.float().cpu().tolist())
+        return embeddings
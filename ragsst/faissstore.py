@@ -0,0 +1,109 @@
+import os
+import numpy as np
+import faiss
+from typing import List, Any
+
+
+class FaissStore:
+    """FAISS index mirroring a Chroma collection, used to serve semantic queries.
+
+    The Chroma collection stays the source of truth: the index is built from the
+    embeddings stored there and persisted as <path>.faiss. Documents, sources and
+    parts are kept as parallel NumPy arrays (<path>.npz), indexed directly by the
+    search results, along with a fingerprint of the collection content the index was
+    built from. Query results follow the Chroma query result layout.
+    """
+
+    # Above this size an approximate HNSW index replaces the exact flat index
+    HNSW_THRESHOLD = 100_000
+
+    def __init__(self, path: str):
+        self.path = path
+        self.index = None
+        self.ids = np.empty(0, dtype=object)
+        self.documents = np.empty(0, dtype=object)
+        self.sources = np.empty(0, dtype=object)
+        self.parts = np.empty(0, dtype=np.int32)
+        self.fingerprint = ''
+
+    def count(self) -> int:
+        return self.index.ntotal if self.index is not None else 0
+
+    def build(
+        self,
+        ids: List[str],
+        embeddings: Any,
+        documents: List[str],
+        metadatas: List[dict],
+        fingerprint: str = '',
+    ) -> None:
+        """Index the given entries, replacing the current content"""
+        self.fingerprint = fingerprint
+        self.ids = np.array(ids, dtype=object)
+        self.documents = np.array(documents, dtype=object)
+        self.sources = np.array([m.get('source') for m in metadatas], dtype=object)
+        self.parts = np.array([m.get('part', 0) for m in metadatas], dtype=np.int32)
+        if not len(self.ids):
+            self.index = None
+            return
+        vectors = np.ascontiguousarray(embeddings, dtype=np.float32)
+        faiss.normalize_L2(vectors)
+        dim = vectors.shape[1]
+        if len(vectors) > self.HNSW_THRESHOLD:
+            self.index = faiss.IndexHNSWFlat(dim, 32, faiss.METRIC_INNER_PRODUCT)
+        else:
+            self.index = faiss.IndexFlatIP(dim)
+        self.index.add(vectors)
+
+    def query(self, query_embeddings: Any, n_results: int = 2) -> dict:
+        """Search the nearest entries. Distances are cosine distances, as in Chroma"""
+        queries = np.ascontiguousarray(query_embeddings, dtype=np.float32)
+        faiss.normalize_L2(queries)
+        scores, indices = self.index.search(queries, n_results)
+        result = {'ids': [], 'documents': [], 'metadatas': [], 'distances': []}
+        for row_scores, row_indices in zip(scores, indices):
+            found = row_indices >= 0
+            idx = row_indices[found]
+            result['ids'].append(self.ids[idx].tolist())
+            result['documents'].append(self.documents[idx].tolist())
+            result['metadatas'].append(
+                [
+                    {'source': source, 'part': part}
+                    for source, part in zip(self.sources[idx], self.parts[idx].tolist())
+                ]
+            )
+            result['distances'].append((1 - row_scores[found]).tolist())
+        return result
+
+    def save(self) -> None:
+        if self.index is None:
+            self.remove()
+            return
+        faiss.write_index(self.index, self.path + '.faiss')
+        np.savez(
+            self.path + '.npz',
+            ids=self.ids,
+            documents=self.documents,
+            sources=self.sources,
+            parts=self.parts,
+            fingerprint=self.fingerprint,
+        )
+
+    def load(self) -> bool:
+        """Load a persisted index. Returns False if there is none"""
+        if not (os.path.exists(self.path + '.faiss') and os.path.exists(self.path + '.npz')):
+            return False
+        self.index = faiss.read_index(self.path + '.faiss')
+        with np.load(self.path + '.npz', allow_pickle=True) as arrays:
+            self.ids = arrays['ids']
+            self.documents = arrays['documents']
+            self.sources = arrays['sources']
+            self.parts = arrays['parts']
+            self.fingerprint = str(arrays['fingerprint']) if 'fingerprint' in arrays else ''
+        return True
+
+    def remove(self) -> None:
+        """Delete the persisted index files"""
+        for ext in ('.faiss', '.npz'):
+            if os.path.exists(self.path + ext):
+                os.remove(self.path + ext)
@@ -17,8 +17,32 @@ def make_interface(ragsst: RAGTool) -> Any:
         "Top k": "LLM Parameter. A higher value will produce more varied text",
         "Top p": "LLM Parameter. A higher value will produce more varied text",
         "Temp": "LLM Parameter. Higher values increase the randomness of the answer",
+        "Vw": "Weight of the semantic search results in the hybrid retrieval",
+        "Kw": "Weight of the keyword (BM25) search results in the hybrid retrieval",
     }
 
+    def hybrid_search_inputs():
+        return [
+            gr.Slider(
+                0,
+                1,
+                value=1,
+                step=0.1,
+                label="Vector weight",
+                info=pinfo.get("Vw"),
+                visible=p.HYBRID_SEARCH,
+            ),
+            gr.Slider(
+                0,
+                1,
+                value=1,
+                step=0.1,
+                label="Keyword weight",
+                info=pinfo.get("Kw"),
+                visible=p.HYBRID_SEARCH,
+            ),
+        ]
+
     rag_query_ui = gr.Interface(
         ragsst.rag_query,
         gr.Textbox(label="Query"),
@@ -37,6 +61,7 @@ def make_interface(ragsst: RAGTool) -> Any:
                 0.1, 1, value=0.9, step=0.1, label="Top p", info=pinfo.get("Top p"), visible=False
             ),
             gr.Slider(0.1, 1, value=0.3, step=0.1, label="Temp", info=pinfo.get("Temp")),
+            *hybrid_search_inputs(),
         ],
         additional_inputs_accordion=gr.Accordion(label="Settings", open=False),
         clear_btn=None,
@@ -64,6 +89,7 @@ def make_interface(ragsst: RAGTool) -> Any:
         ragsst.rag_chat,
         description="Query and interact with an LLM considering your documents information.",
         chatbot=gr.Chatbot(height=500),
+        concurrency_limit=1,  # The chat history is shared
         additional_inputs=[
             gr.Slider(
                 0, 1, value=0.5, step=0.1, label="Relevance threshold", info=pinfo.get("Rth")
@@ -74,6 +100,7 @@ def make_interface(ragsst: RAGTool) -> Any:
                 0.1, 1, value=0.9, step=0.1, label="Top p", info=pinfo.get("Top p"), visible=False
             ),
             gr.Slider(0.1, 1, value=0.3, step=0.1, label="Temp", info=pinfo.get("Temp")),
+            *hybrid_search_inputs(),
         ],
         additional_inputs_accordion=gr.Accordion(label="Settings", open=False),
         undo_btn=None,
@@ -84,6 +111,7 @@ def make_interface(ragsst: RAGTool) -> Any:
         ragsst.chat,
         description="Simply chat with the LLM, without document context.",
         chatbot=gr.Chatbot(height=500),
+        concurrency_limit=1,  # The chat history is shared
         additional_inputs=[
             gr.Slider(1, 10, value=5, step=1, label="Top k", info=pinfo.get("Top k")),
             gr.Slider(0.1, 1, value=0.9, step=0.1, label="Top p", info=pinfo.get("Top p")),
@@ -155,8 +183,19 @@ def make_interface(ragsst: RAGTool) -> Any:
                     interactive=True,
                 )
 
-                setcollection_btn.click(ragsst.set_collection, inputs=[collection_name, emb_model])
-                deletecollection_btn.click(ragsst.delete_collection, inputs=collection_name)
+                # Settings handlers change the shared RAGTool state: run them one at a time
+                setcollection_btn.click(
+                    ragsst.set_collection,
+                    inputs=[collection_name, emb_model],
+                    concurrency_limit=1,
+                    concurrency_id="settings",
+                )
+                deletecollection_btn.click(
+                    ragsst.delete_collection,
+                    inputs=collection_name,
+                    concurrency_limit=1,
+                    concurrency_id="settings",
+                )
 
                 with gr.Row():
                     makedb_btn = gr.Button("Make/Update Database", size='lg', scale=2)
@@ -166,8 +205,12 @@ def make_interface(ragsst: RAGTool) -> Any:
                     fn=make_db,
                     inputs=[data_path, collection_name, emb_model],
                     outputs=info_output,
+                    concurrency_limit=1,
+                    concurrency_id="settings",
+                )
+                deletedb_btn.click(
+                    fn=ragsst.clean_database, concurrency_limit=1, concurrency_id="settings"
                 )
-                deletedb_btn.click(fn=ragsst.clean_database)
                 info_output.change(update_collections_list, collection_name, collection_name)
 
             with gr.Column(scale=2):
@@ -183,7 +226,12 @@ def make_interface(ragsst: RAGTool) -> Any:
                 )
 
                 setllm_btn = gr.Button("Set Choice", size='sm')
-                setllm_btn.click(fn=ragsst.set_model, inputs=model_name)
+                setllm_btn.click(
+                    fn=ragsst.set_model,
+                    inputs=model_name,
+                    concurrency_limit=1,
+                    concurrency_id="settings",
+                )
 
                 pull_model_name = gr.Dropdown(
                     info="Download a LLM (Internet connection is required)",
@@ -195,7 +243,12 @@ def make_interface(ragsst: RAGTool) -> Any:
                 )
                 setllm_btn = gr.Button("Download", size='sm')
                 pull_info = gr.Textbox(label="Info")
-                setllm_btn.click(fn=ragsst.pull_model, inputs=pull_model_name, outputs=pull_info)
+                setllm_btn.click(
+                    fn=ragsst.pull_model,
+                    inputs=pull_model_name,
+                    outputs=pull_info,
+                    concurrency_limit=1,
+                )
 
                 def update_local_models_list(progress_info):
                     if "success" in progress_info.lower():
@@ -211,5 +264,6 @@ def make_interface(ragsst: RAGTool) -> Any:
         ["RAG Query", "Semantic Retrieval", "RAG Chat", "Chat", "Rag Tool Settings"],
         title="Local RAG Tool",
     )
+    gui.queue(default_concurrency_limit=p.UI_CONCURRENCY, max_size=p.UI_QUEUE_SIZE)
 
     return gui
@@ -9,6 +9,15 @@ DATA_PATH = "data"
 # Vector Store
 VECTOR_DB_PATH = "vector_db"
 COLLECTION_NAME = "my_docs"
+EMBEDDING_BATCH_SIZE = 128  # Number of chunks embedded and stored per call
+QUERY_CACHE_SIZE = 1024  # Number of query embeddings kept in memory
+FAISS_SEARCH = False  # Serve semantic queries from a FAISS index of the collection
+MODELS_CACHE_PATH = "cache"  # Exported/optimized embedding models
+# Embedding backend: "sentence-transformers", "onnx" (CPU optimized) or "torchscript" (fast start)
+EMBEDDING_BACKEND = "sentence-transformers"  # "onnx" requires: pip3 install optimum[onnxruntime]
+EMBEDDING_PRECISION = "fp32"  # "fp32", "fp16" (GPU only) or "int8" (CPU)
+EMBEDDING_DEVICE = None  # "cuda", "cpu" or None to use a GPU when available
+CPU_THREADS = None  # Threads for CPU encoding. None uses all available cores
 
 # Text embedding models choices
 EMBEDDING_MODELS = [
@@ -32,12 +41,17 @@ LLM_CHOICES = [
     "dolphin-llama3",
     "zephyr",
 ]
+LLM_TIMEOUT = 300  # Seconds to wait for an LLM response
 
 # Other Features
 EXPORT_PATH = "exports"
+UI_CONCURRENCY = 8  # Requests processed at once per UI function
+UI_QUEUE_SIZE = 64  # Max number of requests waiting in the UI queue
 CONVERSATION_LENTGH = 10  # Max number of interactions kept for dialogue history context
 KEYWORD_SEARCH = True  # Alternative keyword search
 FILTER_BY_KEYWORD = True  # Optimize semantic retrieval with keyword
+HYBRID_SEARCH = False  # Fuse semantic and BM25 keyword search results (reciprocal rank fusion)
+HYBRID_CANDIDATES = 20  # Results taken from each search before fusion
 
 # Internal
 LOG_DIR = 'log'
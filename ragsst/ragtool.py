@@ -1,16 +1,31 @@
 import os
 import logging
+import httpx
+import torch
+import numpy as np
 import chromadb
 from chromadb.utils import embedding_functions
-import requests, json
+from chromadb.api.types import EmbeddingFunction
+import json
+import orjson
+import functools
+import multiprocessing
+import hashlib
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
 from tqdm import tqdm
-from typing import List, Any, Generator, Deque
+from typing import List, Any, Generator, Deque, Tuple
 from collections import deque
-from ragsst.utils import list_files, read_file, split_text, hash_file
+from ragsst.utils import list_files, read_and_split, split_text_by_tokens, hash_file
+from ragsst.faissstore import FaissStore
+from ragsst.bm25index import BM25Index
+from ragsst.embeddings import (
+    OnnxEmbeddingFunction,
+    QuantizedSentenceTransformerEmbeddingFunction,
+    TorchScriptEmbeddingFunction,
+)
 from yake import KeywordExtractor
 import ragsst.parameters as p
 
-
 logging.basicConfig(format=os.getenv('LOG_FORMAT', '%(asctime)s [%(levelname)s] %(message)s'))
 logger = logging.getLogger(__name__)
 logger.setLevel(os.getenv('LOG_LEVEL', logging.INFO))
@@ -20,6 +35,33 @@ logger.addHandler(logging.FileHandler(os.path.join(p.LOG_DIR, p.LOG_FILE), mode=
 MODEL = p.LLM_CHOICES[0]
 EMBEDDING_MODEL = p.EMBEDDING_MODELS[0]
 
+# Reciprocal rank fusion constant
+RRF_K = 60
+
+# Prompt templates
+CONTEXT_PROMPT_TEMPLATE = (
+    "Use the following context to answer the query at the end. "
+    "Keep the answer as concise as possible.\n"
+    "Context:\n"
+    "{context}"
+    "\nQuery:\n"
+    "{query}"
+)
+CONDENSER_PROMPT_TEMPLATE = (
+    "Given the following chat history and a follow up query, rephrase the follow up query to be a standalone query. "
+    "Just create the standalone query without commentary. Use the same language."
+    "\nChat history:\n"
+    "{history}"
+    "\nFollow Up Query: {query}"
+    "\nStandalone Query:"
+)
+
+# Ollama HTTP client settings
+HTTP_TIMEOUT = httpx.Timeout(p.LLM_TIMEOUT, connect=10.0)
+HTTP_LIMITS = httpx.Limits(
+    max_keepalive_connections=40, max_connections=100, keepalive_expiry=30.0
+)
+
 
 class RAGTool:
     def __init__(
@@ -32,18 +74,22 @@ class RAGTool:
     ):
         self.model = model
         self.llm_base_url = llm_base_url
+        self._http = httpx.Client(http2=True, timeout=HTTP_TIMEOUT, limits=HTTP_LIMITS)
         self.max_conversation_length = p.CONVERSATION_LENTGH
-        self.conversation = deque(maxlen=self.max_conversation_length)
+        self.conversation: List[dict] = []
         self.rag_conversation = deque(maxlen=self.max_conversation_length)
         self.data_path = data_path
         self.embedding_model = embedding_model
         self.collection_name = collection_name
+        self.faiss_store = None
+        self.bm25_index = None
         self.vs_client = chromadb.PersistentClient(
             path=p.VECTOR_DB_PATH, settings=chromadb.Settings(allow_reset=True)
         )
-        self.embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=self.embedding_model, trust_remote_code=True
-        )
+        self._set_cpu_threads()
+        self.embedding_func = self._make_embedding_func()
+        self.tokenizer = self._embedding_tokenizer()
+        self._qcache = functools.lru_cache(maxsize=p.QUERY_CACHE_SIZE)(self._embed_query)
         if p.KEYWORD_SEARCH or p.FILTER_BY_KEYWORD:
             self.kw_extractor = KeywordExtractor(
                 lan="auto",
@@ -59,40 +105,63 @@ class RAGTool:
         self, prompt: str, top_k: int = 5, top_p: float = 0.9, temp: float = 0.2
     ) -> str:
         url = self.llm_base_url + "/generate"
-        data = {
-            "model": self.model,
-            "prompt": prompt,
-            "stream": False,
-            "options": {"temperature": temp, "top_p": top_p, "top_k": top_k},
-        }
+        data = self._generate_request(prompt, False, top_k, top_p, temp)
 
         try:
-            r = requests.post(url, json=data)
-            response_dic = json.loads(r.text)
+            r = self._http.post(url, json=data)
+            response_dic = orjson.loads(r.content)
             response = response_dic.get('response', '')
             return response if response else response_dic.get('error', 'Check Ollama Settings')
 
         except Exception as e:
             logger.error(f"Exception: {e}\nResponse:{response_dic}")
 
+    def llm_generate_stream(
+        self, prompt: str, top_k: int = 5, top_p: float = 0.9, temp: float = 0.2
+    ) -> Generator[str, None, None]:
+        """Yield the response tokens as they are generated"""
+        url = self.llm_base_url + "/generate"
+        data = self._generate_request(prompt, True, top_k, top_p, temp)
+
+        try:
+            with self._http.stream("POST", url, json=data) as r:
+                for line in r.iter_lines():
+                    if line:
+                        chunk = orjson.loads(line)
+                        yield chunk.get('response') or chunk.get('error', '')
+
+        except Exception as e:
+            logger.error(f"Exception: {e}")
+
+    def _generate_request(
+        self, prompt: str, stream: bool, top_k: int, top_p: float, temp: float
+    ) -> dict:
+        """Body of an Ollama /generate request"""
+        return {
+            "model": self.model,
+            "prompt": prompt,
+            "stream": stream,
+            "options": {"temperature": temp, "top_p": top_p, "top_k": top_k},
+        }
+
     def llm_chat(
         self, user_message: str, top_k: int = 5, top_p: float = 0.9, temp: float = 0.5
     ) -> str:
 
         url = self.llm_base_url + "/chat"
-        self.conversation.append({"role": "user", "content": user_message})
+        self._append_to_conversation({"role": "user", "content": user_message})
         data = {
             "model": self.model,
-            "messages": list(self.conversation),
+            "messages": self.conversation,
             "stream": False,
             "options": {"temperature": temp, "top_p": top_p, "top_k": top_k},
         }
 
         try:
-            r = requests.post(url, json=data)
-            response_dic = json.loads(r.text)
+            r = self._http.post(url, json=data)
+            response_dic = orjson.loads(r.content)
             response = response_dic.get('message', '')
-            self.conversation.append(response)
+            self._append_to_conversation(response)
             logger.debug("-" * 100)
             logger.debug("\n".join(map(str, self.conversation)))
             return response.get('content', '')
@@ -100,13 +169,43 @@ class RAGTool:
         except Exception as e:
             logger.error(f"Exception: {e}\nResponse:{response_dic}")
 
+    def llm_chat_stream(
+        self, user_message: str, top_k: int = 5, top_p: float = 0.9, temp: float = 0.5
+    ) -> Generator[str, None, None]:
+        """Yield the chat response tokens as they are generated"""
+
+        url = self.llm_base_url + "/chat"
+        self._append_to_conversation({"role": "user", "content": user_message})
+        data = {
+            "model": self.model,
+            "messages": self.conversation,
+            "stream": True,
+            "options": {"temperature": temp, "top_p": top_p, "top_k": top_k},
+        }
+
+        try:
+            content = ''
+            with self._http.stream("POST", url, json=data) as r:
+                for line in r.iter_lines():
+                    if line:
+                        chunk = orjson.loads(line)
+                        token = chunk.get('message', {}).get('content') or chunk.get('error', '')
+                        content += token
+                        yield token
+            self._append_to_conversation({"role": "assistant", "content": content})
+            logger.debug("-" * 100)
+            logger.debug("\n".join(map(str, self.conversation)))
+
+        except Exception as e:
+            logger.error(f"Exception: {e}")
+
     def list_local_models(self) -> List:
 
         url = self.llm_base_url + "/tags"
 
         try:
-            r = requests.get(url)
-            response_dic = json.loads(r.text)
+            r = self._http.get(url)
+            response_dic = orjson.loads(r.content)
             models_names = [model.get("name") for model in response_dic.get("models")]
             return models_names
 
@@ -120,12 +219,12 @@ class RAGTool:
         data = {"name": model_name}
 
         try:
-            r = requests.post(url, json=data, stream=True)
-            r.raise_for_status()
-            for content in r.iter_lines():
-                if content:
-                    content_dict = json.loads(content)
-                    yield f"Status: {content_dict.get('status')}"
+            with self._http.stream("POST", url, json=data) as r:
+                r.raise_for_status()
+                for content in r.iter_lines():
+                    if content:
+                        content_dict = orjson.loads(content)
+                        yield f"Status: {content_dict.get('status')}"
 
         except Exception as e:
             logger.error(f"Exception: {e}\nResponse:{r}")
@@ -144,6 +243,42 @@ class RAGTool:
         logger.info(
             f"Set Collection: {self.collection_name}. Embedding Model: {self.embedding_model}"
         )
+        if p.FAISS_SEARCH:
+            self._sync_faiss_store()
+        if p.HYBRID_SEARCH:
+            self._sync_bm25_index()
+
+    def _sync_faiss_store(self, rebuild: bool = False) -> None:
+        """Load the FAISS index of the set collection, (re)building it when outdated"""
+        faiss_store = FaissStore(os.path.join(p.VECTOR_DB_PATH, self.collection_name))
+        fingerprint = self._collection_fingerprint()
+        if rebuild or not faiss_store.load() or faiss_store.fingerprint != fingerprint:
+            logger.info(f"Building FAISS index for {self.collection_name} ...")
+            entries = self.collection.get(include=['embeddings', 'documents', 'metadatas'])
+            faiss_store.build(
+                entries['ids'],
+                entries['embeddings'],
+                entries['documents'],
+                entries['metadatas'],
+                fingerprint,
+            )
+            faiss_store.save()
+        # Queries can run meanwhile: swap the index in only once it is complete
+        self.faiss_store = faiss_store
+
+    def _sync_bm25_index(self, rebuild: bool = False) -> None:
+        """Load the BM25 index of the set collection, (re)building it when outdated"""
+        bm25_index = BM25Index(os.path.join(p.VECTOR_DB_PATH, self.collection_name))
+        fingerprint = self._collection_fingerprint()
+        if rebuild or not bm25_index.load() or bm25_index.fingerprint != fingerprint:
+            logger.info(f"Building BM25 index for {self.collection_name} ...")
+            entries = self.collection.get(include=['documents', 'metadatas'])
+            bm25_index.build(
+                entries['ids'], entries['documents'], entries['metadatas'], fingerprint
+            )
+            bm25_index.save()
+        # Queries can run meanwhile: swap the index in only once it is complete
+        self.bm25_index = bm25_index
 
     def make_collection(
         self,
@@ -163,53 +298,152 @@ class RAGTool:
         logger.debug(f"Files: {', '.join([f.replace(data_path, '', 1) for f  in files])}")
         logger.info("Populating embeddings database...")
 
-        if skip_included_files:
-            sources = {
-                m.get('source')
-                for m in self.collection.get(include=['metadatas']).get('metadatas')
-            }
-            if consider_content:
-                files_hashes = {
-                    m.get('file_hash')
-                    for m in self.collection.get(include=['metadatas']).get('metadatas')
-                }
+        # Ingested file names and their hashes
+        sources = self._load_ingested_sources()
 
+        updated = False
+        pending = {}
         for f in files:
             _, file_name = os.path.split(f)
-            if consider_content:
-                file_hash = hash_file(f)
+            file_hash = hash_file(f) if consider_content else None
 
             if skip_included_files and file_name in sources:
                 if not consider_content:
                     logger.info(f"{file_name} name already in Vector-DB, skipping...")
                     continue
 
-                if file_hash in files_hashes:
+                if file_hash == sources[file_name]:
                     logger.info(f"{file_name} content already in Vector-DB, skipping...")
                     continue
 
                 logger.info(f"Updating DB for {file_name} ...")
                 self.collection.delete(where={"source": file_name})
-
-            logger.info(f"Reading and splitting {file_name} ...")
-            text = read_file(f)
-            chunks = split_text(text)
-            logger.info(f"Resulting segment count: {len(chunks)}")
-            logger.info(f"Embedding and storing {file_name} ...")
-
-            for i, c in tqdm(enumerate(chunks, 1), total=len(chunks)):
-                metadata = {"source": file_name, "part": i}
-                if consider_content:
-                    metadata["file_hash"] = file_hash
-
-                self.collection.add(
-                    documents=c,
-                    ids=f"id{file_name[:-4]}.{i}",
-                    metadatas=metadata,
-                )
+                del sources[file_name]
+                self._save_ingested_sources(sources)
+                updated = True
+
+            pending[f] = (file_name, file_hash)
+
+        if pending:
+            # Read and split files in parallel processes, embedding each file as soon as
+            # its chunks are ready while the remaining files are still being parsed
+            logger.info(f"Reading and splitting {len(pending)} files ...")
+            # Spawn the workers: forking this process would copy its torch, tokenizers
+            # and server threads. The workers only need ragsst.utils
+            with ProcessPoolExecutor(
+                max_workers=min(len(pending), os.cpu_count() or 1),
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as pool:
+                futures = {pool.submit(read_and_split, f): f for f in pending}
+                for future in as_completed(futures):
+                    file_name, file_hash = pending[futures[future]]
+                    self._add_chunks(future.result(), file_name, file_hash)
+                    sources[file_name] = file_hash
+                    self._save_ingested_sources(sources)
+            updated = True
+
+        if updated and p.FAISS_SEARCH:
+            self._sync_faiss_store(rebuild=True)
+        if updated and p.HYBRID_SEARCH:
+            self._sync_bm25_index(rebuild=True)
 
         logger.info(f"Available collections: {self.list_collections_names_w_metainfo()}")
 
+    def _load_ingested_sources(self) -> dict:
+        """Get the ingested file names and hashes of the set collection.
+
+        They are kept in a sidecar file, so the collection metadata is only scanned
+        when it is missing.
+        """
+        path = os.path.join(p.VECTOR_DB_PATH, self.collection_name + '.sources.json')
+        if os.path.exists(path):
+            with open(path, 'r') as f:
+                return json.load(f)
+        sources = {
+            m.get('source'): m.get('file_hash')
+            for m in self.collection.get(include=['metadatas']).get('metadatas')
+        }
+        self._save_ingested_sources(sources)
+        return sources
+
+    def _collection_fingerprint(self) -> str:
+        """Fingerprint of the set collection content: its size and ingested file hashes"""
+        sources = json.dumps(self._load_ingested_sources(), sort_keys=True)
+        digest = hashlib.sha256(sources.encode()).hexdigest()
+        return f"{self.collection.count()}-{digest}"
+
+    def _save_ingested_sources(self, sources: dict) -> None:
+        path = os.path.join(p.VECTOR_DB_PATH, self.collection_name + '.sources.json')
+        with open(path, 'w') as f:
+            json.dump(sources, f)
+
+    def _add_chunks(self, chunks: List[str], file_name: str, file_hash: str | None) -> None:
+        """Embed and store the chunks of a file"""
+
+        chunks, tokens = self._fit_to_max_seq_length(chunks)
+        logger.info(f"{file_name} segment count: {len(chunks)}")
+        logger.info(f"Embedding and storing {file_name} ...")
+
+        ids = [f"id{file_name[:-4]}.{i}" for i, _ in enumerate(chunks, 1)]
+        metadatas = [
+            {"source": file_name, "part": i, "tokens": n} for i, n in enumerate(tokens, 1)
+        ]
+        if file_hash is not None:
+            for metadata in metadatas:
+                metadata["file_hash"] = file_hash
+
+        # Sort by token length so each batch is padded to a similar size.
+        # Original order is kept through the "part" metadata and the ids.
+        order = sorted(range(len(chunks)), key=lambda i: tokens[i])
+        chunks = [chunks[i] for i in order]
+        ids = [ids[i] for i in order]
+        metadatas = [metadatas[i] for i in order]
+
+        # Embed and store chunks in batches
+        batch_size = p.EMBEDDING_BATCH_SIZE
+        for start in tqdm(range(0, len(chunks), batch_size)):
+            self.collection.add(
+                documents=chunks[start : start + batch_size],
+                ids=ids[start : start + batch_size],
+                metadatas=metadatas[start : start + batch_size],
+            )
+
+    def _fit_to_max_seq_length(self, chunks: List[str]) -> Tuple[List[str], List[int]]:
+        """Re-split chunks the embedding model would truncate. Returns chunks and token counts"""
+
+        if not chunks:
+            return [], []
+
+        model = getattr(self.embedding_func, '_model', self.embedding_func)
+        max_length = min(
+            getattr(model, 'max_seq_length', None) or self.tokenizer.model_max_length,
+            self.tokenizer.model_max_length,
+        )
+
+        def count_tokens(texts: List[str]) -> List[int]:
+            return self.tokenizer(
+                texts, add_special_tokens=True, truncation=False, return_length=True
+            )['length']
+
+        tokens = count_tokens(chunks)
+        if max(tokens) <= max_length:
+            return chunks, tokens
+
+        fitted = []
+        for chunk, n in zip(chunks, tokens):
+            if n > max_length:
+                fitted.extend(
+                    split_text_by_tokens(
+                        chunk,
+                        self.tokenizer,
+                        max_length - self.tokenizer.num_special_tokens_to_add(),
+                    )
+                )
+            else:
+                fitted.append(chunk)
+        logger.debug(f"Chunks over {max_length} tokens re-split: {len(chunks)} -> {len(fitted)}")
+        return fitted, count_tokens(fitted)
+
     # ============== Semantic Search / Retrieval ===============================
 
     def retrieve_content_w_meta_info(
@@ -217,34 +451,30 @@ class RAGTool:
     ) -> str:
         """Get list of relevant content from a collection including similarity and sources"""
 
-        query_result = self.collection.query(query_texts=query, n_results=nresults)
-
-        docs_selection = []
-
-        for i in range(len(query_result.get('ids')[0])):
+        query_result = self._semantic_query(query, nresults)
 
-            sim = round(1 - query_result.get('distances')[0][i], 2)
+        similarities = np.round(1 - np.asarray(query_result.get('distances')[0]), 2)
+        docs = np.asarray(query_result.get('documents')[0], dtype=object)
+        metadatas = np.asarray(query_result.get('metadatas')[0], dtype=object)
 
-            if sim_th is not None:
-                if sim < sim_th:
-                    continue
-
-            doc = query_result.get('documents')[0][i]
-            metadata = query_result.get('metadatas')[0][i]
-            docs_selection.append(
-                '\n'.join(
-                    [
-                        doc,
-                        f"Relevance: {sim}",
-                        f"Source: {metadata.get('source')} (part {metadata.get('part')})",
-                    ]
-                )
-            )
+        if sim_th is not None:
+            mask = similarities >= sim_th
+            docs, metadatas, similarities = docs[mask], metadatas[mask], similarities[mask]
 
-        if not docs_selection:
+        if not len(docs):
             return "Relevant passage not found. Try lowering the relevance threshold."
 
-        return "\n-----------------\n\n".join(docs_selection)
+        return "\n-----------------\n\n".join(
+            f"{doc}\nRelevance: {sim}\nSource: {meta.get('source')} (part {meta.get('part')})"
+            for doc, sim, meta in zip(docs, similarities.tolist(), metadatas)
+        )
+
+    def _semantic_query(self, query: str, nresults: int) -> dict:
+        """Query the FAISS index if enabled and populated, the Chroma collection otherwise"""
+        query_embeddings = [self._qcache(query.strip())]
+        if self.faiss_store is not None and self.faiss_store.count():
+            return self.faiss_store.query(query_embeddings, n_results=nresults)
+        return self.collection.query(query_embeddings=query_embeddings, n_results=nresults)
 
     def get_relevant_text(
         self,
@@ -253,10 +483,17 @@ class RAGTool:
         sim_th: float | None = None,
         keyword_filter: bool = p.FILTER_BY_KEYWORD,
         keyword_search: bool = p.KEYWORD_SEARCH,
+        vector_weight: float = 1.0,
+        keyword_weight: float = 1.0,
     ) -> str:
         """Get relevant text from a collection for a given query"""
 
-        query_result = self.collection.query(query_texts=query, n_results=nresults)
+        if p.HYBRID_SEARCH and self.bm25_index is not None and self.bm25_index.count():
+            return self._get_relevant_text_hybrid(
+                query, nresults, sim_th, vector_weight, keyword_weight
+            )
+
+        query_result = self._semantic_query(query, nresults)
 
         if sim_th is not None:
             # Filter documents based on similarity threshold
@@ -289,46 +526,86 @@ class RAGTool:
         logger.info(f"Sources:  {', '.join(self._get_sources(query_result))}")
         return '\n'.join(docs)
 
+    def _get_relevant_text_hybrid(
+        self,
+        query: str,
+        nresults: int,
+        sim_th: float | None,
+        vector_weight: float,
+        keyword_weight: float,
+    ) -> str:
+        """Fuse semantic and BM25 search results by weighted reciprocal rank"""
+
+        # Run both searches in parallel
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            semantic = executor.submit(self._semantic_query, query, p.HYBRID_CANDIDATES)
+            keyword = executor.submit(self.bm25_index.query, query, p.HYBRID_CANDIDATES)
+            semantic_result, keyword_result = semantic.result(), keyword.result()
+
+        if sim_th is not None:
+            semantic_result = self._filter_query_by_similarity(semantic_result, sim_th) or {
+                'ids': [[]],
+                'documents': [[]],
+                'metadatas': [[]],
+            }
+
+        scores = {}
+        entries = {}
+        for weight, result in ((vector_weight, semantic_result), (keyword_weight, keyword_result)):
+            if not weight:
+                continue
+            for rank, entry in enumerate(
+                zip(result['ids'][0], result['documents'][0], result['metadatas'][0]), 1
+            ):
+                scores[entry[0]] = scores.get(entry[0], 0) + weight / (RRF_K + rank)
+                entries[entry[0]] = entry
+
+        best = sorted(scores, key=scores.get, reverse=True)[:nresults]
+        logger.info(f"Sources:  {', '.join({entries[i][2].get('source') for i in best})}")
+        return '\n'.join(entries[i][1] for i in best)
+
     # ============== Retrieval Augemented Generation ===========================
 
     def get_context_prompt(self, query: str, context: str) -> str:
-        contextual_prompt = (
-            "Use the following context to answer the query at the end. "
-            "Keep the answer as concise as possible.\n"
-            "Context:\n"
-            f"{context}"
-            "\nQuery:\n"
-            f"{query}"
-        )
-
-        return contextual_prompt
+        return CONTEXT_PROMPT_TEMPLATE.format(context=context, query=query)
 
     def get_condenser_prompt(self, query: str, chat_history: Deque) -> str:
-        history = '\n'.join(list(chat_history))
-        condenser_prompt = (
-            "Given the following chat history and a follow up query, rephrase the follow up query to be a standalone query. "
-            "Just create the standalone query without commentary. Use the same language."
-            "\nChat history:\n"
-            f"{history}"
-            f"\nFollow Up Query: {query}"
-            "\nStandalone Query:"
-        )
-        return condenser_prompt
+        history = '\n'.join(chat_history)
+        return CONDENSER_PROMPT_TEMPLATE.format(history=history, query=query)
 
     def rag_query(
-        self, user_msg: str, sim_th: float, nresults: int, top_k: int, top_p: float, temp: float
-    ) -> str:
+        self,
+        user_msg: str,
+        sim_th: float,
+        nresults: int,
+        top_k: int,
+        top_p: float,
+        temp: float,
+        vector_weight: float = 1.0,
+        keyword_weight: float = 1.0,
+    ) -> Generator[str, None, None]:
         logger.debug(
             f"rag_query args: sim_th: {sim_th}, nresults: {nresults}, top_k: {top_k}, top_p: {top_p}, temp: {temp}"
         )
-        relevant_text = self.get_relevant_text(user_msg, nresults=nresults, sim_th=sim_th)
+        relevant_text = self.get_relevant_text(
+            user_msg,
+            nresults=nresults,
+            sim_th=sim_th,
+            vector_weight=vector_weight,
+            keyword_weight=keyword_weight,
+        )
         logger.debug(f"\nSelected Relevant Context:\n{relevant_text}")
 
         if not relevant_text:
-            return "Relevant passage not found. Try lowering the relevance threshold."
+            yield "Relevant passage not found. Try lowering the relevance threshold."
+            return
         contextualized_query = self.get_context_prompt(user_msg, relevant_text)
-        bot_response = self.llm_generate(contextualized_query, top_k=top_k, top_p=top_p, temp=temp)
-        return bot_response
+        bot_response = ''
+        for token in self.llm_generate_stream(
+            contextualized_query, top_k=top_k, top_p=top_p, temp=temp
+        ):
+            bot_response += token
+            yield bot_response
 
     def rag_chat(
         self,
@@ -339,24 +616,36 @@ class RAGTool:
         top_k: int,
         top_p: float,
         temp: float,
-    ) -> str:
+        vector_weight: float = 1.0,
+        keyword_weight: float = 1.0,
+    ) -> Generator[str, None, None]:
         logger.debug(
             f"rag_chat args: sim_th: {sim_th}, nresults: {nresults}, top_k: {top_k}, top_p: {top_p}, temp: {temp}"
         )
         MSG_NO_CONTEXT = "Relevant passage not found. Try lowering the relevance threshold."
 
         if not self.rag_conversation:
-            relevant_text = self.get_relevant_text(user_msg, nresults=nresults, sim_th=sim_th)
+            relevant_text = self.get_relevant_text(
+                user_msg,
+                nresults=nresults,
+                sim_th=sim_th,
+                vector_weight=vector_weight,
+                keyword_weight=keyword_weight,
+            )
             if not relevant_text:
-                return MSG_NO_CONTEXT
+                yield MSG_NO_CONTEXT
+                return
             logger.debug(f"\nSelected Relevant Context:\n{relevant_text}")
             self.rag_conversation.append('Query: ' + user_msg)
             contextualized_query = self.get_context_prompt(user_msg, relevant_text)
-            bot_response = self.llm_generate(
+            bot_response = ''
+            for token in self.llm_generate_stream(
                 contextualized_query, top_k=top_k, top_p=top_p, temp=temp
-            )
+            ):
+                bot_response += token
+                yield bot_response
             self.rag_conversation.append('Answer: ' + bot_response)
-            return bot_response
+            return
 
         condenser_prompt = self.get_condenser_prompt(user_msg, self.rag_conversation)
         logger.debug(f"\nCondenser prompt:\n{condenser_prompt}")
@@ -364,24 +653,37 @@ class RAGTool:
         standalone_query = self.llm_generate(condenser_prompt, top_k=top_k, top_p=top_p, temp=temp)
         logger.debug(f"Standalone query: {standalone_query}")
 
-        relevant_text = self.get_relevant_text(standalone_query, nresults=nresults, sim_th=sim_th)
+        relevant_text = self.get_relevant_text(
+            standalone_query,
+            nresults=nresults,
+            sim_th=sim_th,
+            vector_weight=vector_weight,
+            keyword_weight=keyword_weight,
+        )
         if not relevant_text:
-            return MSG_NO_CONTEXT
+            yield MSG_NO_CONTEXT
+            return
         logger.debug(f"\nPassed Relevant Context:\n{relevant_text}")
         contextualized_standalone_query = self.get_context_prompt(standalone_query, relevant_text)
 
-        bot_response = self.llm_generate(
+        bot_response = ''
+        for token in self.llm_generate_stream(
             contextualized_standalone_query, top_k=top_k, top_p=top_p, temp=temp
-        )
+        ):
+            bot_response += token
+            yield bot_response
         self.rag_conversation.append('Query:\n' + standalone_query)
         self.rag_conversation.append('Answer:\n' + bot_response)
-        return bot_response
 
     # ============== LLM chat w/o Document Context =============================
 
-    def chat(self, user_msg: str, history: Any, top_k: int, top_p: float, temp: float) -> str:
-        bot_response = self.llm_chat(user_msg, top_k=top_k, top_p=top_p, temp=temp)
-        return bot_response
+    def chat(
+        self, user_msg: str, history: Any, top_k: int, top_p: float, temp: float
+    ) -> Generator[str, None, None]:
+        bot_response = ''
+        for token in self.llm_chat_stream(user_msg, top_k=top_k, top_p=top_p, temp=temp):
+            bot_response += token
+            yield bot_response
 
     # ============== Utils =====================================================
     # Methods for internal usage and/or interaction with the GUI
@@ -422,12 +724,72 @@ class RAGTool:
 
     def set_embeddings_model(self, emb_model: str) -> None:
         self.embedding_model = emb_model
-        self.embedding_func = embedding_functions.SentenceTransformerEmbeddingFunction(
-            model_name=self.embedding_model,
-            trust_remote_code=True,
-        )
+        self.embedding_func = self._make_embedding_func()
+        self.tokenizer = self._embedding_tokenizer()
+        self._qcache = functools.lru_cache(maxsize=p.QUERY_CACHE_SIZE)(self._embed_query)
         logger.debug(f"Embedding Model: {self.embedding_model}")
 
+    def _embedding_tokenizer(self) -> Any:
+        """Tokenizer of the loaded embedding model, whatever the backend"""
+        return getattr(self.embedding_func, '_model', self.embedding_func).tokenizer
+
+    def _set_cpu_threads(self) -> None:
+        """Set the thread count for CPU encoding, as container defaults are often too low"""
+        if p.CPU_THREADS:
+            n = p.CPU_THREADS
+        elif hasattr(os, 'sched_getaffinity'):
+            n = len(os.sched_getaffinity(0))
+        else:
+            n = os.cpu_count() or 1
+        os.environ.setdefault("OMP_NUM_THREADS", str(n))
+        os.environ.setdefault("MKL_NUM_THREADS", str(n))
+        torch.set_num_threads(n)
+        try:
+            torch.set_num_interop_threads(max(1, n // 2))
+        except RuntimeError:
+            # Can only be set once, before any inter-op parallel work has started
+            pass
+        logger.info(f"CPU threads: {torch.get_num_threads()}")
+
+    def _make_embedding_func(self) -> EmbeddingFunction:
+        """Embedding function for the current embedding model and configured backend"""
+        precision = p.EMBEDDING_PRECISION
+        device = p.EMBEDDING_DEVICE or ("cuda" if torch.cuda.is_available() else "cpu")
+        logger.info(f"Embedding device: {device}")
+        if p.EMBEDDING_BACKEND == "onnx":
+            try:
+                return OnnxEmbeddingFunction(self.embedding_model, quantize=precision == "int8")
+            except Exception as e:
+                logger.warning(
+                    f"ONNX backend not available for {self.embedding_model} ({e}). "
+                    "Using sentence-transformers"
+                )
+        if p.EMBEDDING_BACKEND == "torchscript":
+            try:
+                return TorchScriptEmbeddingFunction(self.embedding_model, device=device)
+            except Exception as e:
+                logger.warning(
+                    f"TorchScript backend not available for {self.embedding_model} ({e}). "
+                    "Using sentence-transformers"
+                )
+        if precision == "fp16" and device != "cuda":
+            logger.warning("fp16 embeddings require a GPU. Using fp32")
+            precision = "fp32"
+        if precision == "int8" and device != "cpu":
+            logger.warning("int8 embeddings run on CPU only. Using CPU")
+            device = "cpu"
+        if precision != "fp32":
+            logger.info(f"Embedding precision: {precision}")
+            return QuantizedSentenceTransformerEmbeddingFunction(
+                model_name=self.embedding_model,
+                precision=precision,
+                device=device,
+                trust_remote_code=True,
+            )
+        return embedding_functions.SentenceTransformerEmbeddingFunction(
+            model_name=self.embedding_model, device=device, trust_remote_code=True
+        )
+
     def set_data_path(self, data_path: str) -> None:
         self.data_path = data_path
         logger.debug(f"Data Path: {self.data_path}")
@@ -450,7 +812,11 @@ class RAGTool:
     def delete_collection(self, collection_name: str) -> None:
         """Removes chosen collection and sets the first one on the list"""
         self.vs_client.delete_collection(collection_name)
+        self._remove_collection_files(collection_name)
         logger.info(f"{collection_name} removed")
+        if collection_name == self.collection_name:
+            self.faiss_store = None
+            self.bm25_index = None
         collections = self.vs_client.list_collections()
         if collections:
             logger.info(f"Setting first available collection: {collections[0].name}")
@@ -460,13 +826,32 @@ class RAGTool:
 
     def clean_database(self) -> None:
         """Deletes all collections and entries"""
+        for name in self.list_collections_names():
+            self._remove_collection_files(name)
+        self.faiss_store = None
+        self.bm25_index = None
         self.vs_client.reset()
         self.vs_client.clear_system_cache()
         logger.info("Database empty")
 
+    def _remove_collection_files(self, collection_name: str) -> None:
+        """Delete the search indexes and the sources file kept next to a collection"""
+        path = os.path.join(p.VECTOR_DB_PATH, collection_name)
+        FaissStore(path).remove()
+        BM25Index(path).remove()
+        if os.path.exists(path + '.sources.json'):
+            os.remove(path + '.sources.json')
+
     def clear_chat_hist(self) -> None:
         self.conversation.clear()
 
+    def _append_to_conversation(self, message: dict) -> None:
+        """Append a chat message, keeping the last max_conversation_length interactions"""
+        self.conversation.append(message)
+        max_messages = self.max_conversation_length * 2
+        if len(self.conversation) > max_messages:
+            del self.conversation[:-max_messages]
+
     def clear_ragchat_hist(self) -> None:
         self.rag_conversation.clear()
 
@@ -477,28 +862,20 @@ class RAGTool:
 
     def _filter_by_similarity(self, query_result: dict, sim_th: float) -> List[str]:
         """Filter documents based on similarity threshold and return relevant docs"""
-        similarities = [1 - d for d in query_result.get('distances')[0]]
-        relevant_docs = [
-            doc for doc, s in zip(query_result.get('documents')[0], similarities) if s >= sim_th
-        ]
-        return relevant_docs
+        similarities = 1 - np.asarray(query_result.get('distances')[0])
+        docs = np.asarray(query_result.get('documents')[0], dtype=object)
+        return docs[similarities >= sim_th].tolist()
 
     def _filter_query_by_similarity(self, query_result: dict, sim_th: float) -> dict:
         """Filter query results based on similarity threshold."""
-        similarities = [round(1 - d, 2) for d in query_result.get('distances')[0]]
-        relevant_docs = [
-            doc for doc, s in zip(query_result.get('documents')[0], similarities) if s >= sim_th
-        ]
-        if relevant_docs:
-            metadatas = [
-                meta
-                for meta, s in zip(query_result.get('metadatas')[0], similarities)
-                if s >= sim_th
-            ]
-            query_result['documents'][0] = relevant_docs
-            query_result['metadatas'][0] = metadatas
-            return query_result
-        return {}
+        similarities = np.round(1 - np.asarray(query_result.get('distances')[0]), 2)
+        mask = similarities >= sim_th
+        if not mask.any():
+            return {}
+        for key in ('ids', 'documents', 'metadatas', 'distances'):
+            values = np.asarray(query_result[key][0], dtype=object)
+            query_result[key][0] = values[mask].tolist()
+        return query_result
 
     def _filter_query_by_keyword(self, query_result: dict, keyword: str) -> dict:
         """Filter query results based on keyword."""
@@ -518,6 +895,11 @@ class RAGTool:
             return query_result
         return {}
 
+    def _embed_query(self, query: str) -> List[float]:
+        """Embed a query text. Wrapped by an LRU cache (self._qcache) on init."""
+        embedding = self.embedding_func([query])[0]
+        return embedding.tolist() if hasattr(embedding, 'tolist') else list(embedding)
+
     def _get_sources(self, query_result: dict) -> set:
         """Get sources from the query results."""
         return {meta.get("source") for meta in query_result['metadatas'][0]}
@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Tuple, Any
 import os
 from pypdf import PdfReader
 import hashlib
@@ -90,6 +90,57 @@ def split_text(text: str, max_words: int = 256, max_title_words: int = 4) -> Lis
     return chunks
 
 
+def _pack_by_tokens(
+    parts: List[str], counts: List[int], max_tokens: int, separator: str
+) -> List[Tuple[str, int]]:
+    """Greedily join consecutive parts while the sum of their token counts fits max_tokens"""
+
+    packed = []
+    chunk = []
+    chunk_length = 0
+    for part, count in zip(parts, counts):
+        if chunk and chunk_length + count > max_tokens:
+            packed.append((separator.join(chunk), chunk_length))
+            chunk = []
+            chunk_length = 0
+        chunk.append(part)
+        chunk_length += count
+
+    if chunk:
+        packed.append((separator.join(chunk), chunk_length))
+
+    return packed
+
+
+def split_text_by_tokens(text: str, tokenizer: Any, max_tokens: int) -> List[str]:
+    """Split text in chunks of whole lines with at most max_tokens tokens"""
+
+    # List of lines skipping empty lines
+    lines = [l for l in text.splitlines() if l.strip()]
+    if not lines:
+        return []
+    counts = [len(ids) for ids in tokenizer(lines, add_special_tokens=False)['input_ids']]
+
+    pieces = []
+    for line, count in zip(lines, counts):
+        if count <= max_tokens:
+            pieces.append((line, count))
+            continue
+        # Only a line longer than max_tokens is split by words. A single word longer
+        # than max_tokens stays oversized and is truncated by the embedding model
+        words = line.split()
+        word_counts = [len(ids) for ids in tokenizer(words, add_special_tokens=False)['input_ids']]
+        pieces.extend(_pack_by_tokens(words, word_counts, max_tokens, ' '))
+
+    parts, part_counts = zip(*pieces)
+    return [chunk for chunk, _ in _pack_by_tokens(parts, part_counts, max_tokens, '\n')]
+
+
+def read_and_split(doc: str) -> List[str]:
+    """Read a pdf or txt file and split its text in chunks"""
+    return split_text(read_file(doc))
+
+
 def hash_file(filename: str, block_size: int = 128 * 64) -> str:
 
     h = hashlib.sha1()